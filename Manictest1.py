@@ -1,15 +1,22 @@
 import os
-import shutil
 import asyncio
 import logging
+import queue
 import re
+from time import monotonic
 import locale
 from datetime import datetime, timedelta
+from functools import lru_cache, partial
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
 from zoneinfo import ZoneInfo
-from typing import Optional, List
+from typing import Optional
+from weakref import WeakValueDictionary
 
 from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.filters import Command, StateFilter
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import (
     Message, CallbackQuery,
     ReplyKeyboardMarkup, KeyboardButton,
@@ -19,9 +26,21 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from sqlmodel import Field, SQLModel, select, delete
+from sqlmodel import Field, Index, SQLModel, select, delete, insert, update, and_, not_, or_
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+try:
+    import uvloop
+except ImportError:  # нет сборки под Windows
+    uvloop = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 # ================= LOCALE =================
@@ -33,37 +52,146 @@ except locale.Error:
 LOCAL_TZ = ZoneInfo("Asia/Irkutsk")
 
 # ================= CONFIG =================
-PROJECT_FOLDER = "data"
-DB_FILE = os.path.join(PROJECT_FOLDER, "bot.db")
-
-API_TOKEN = os.getenv("BOT_TOKEN")
-if not API_TOKEN:
-    raise RuntimeError("BOT_TOKEN not set")
+PROJECT_FOLDER = Path("data")
+DB_FILE = PROJECT_FOLDER / "bot.db"
+DB_URL = f"sqlite+aiosqlite:///{DB_FILE.as_posix()}"
+DB_READ_URL = f"sqlite+aiosqlite:///file:{DB_FILE.as_posix()}?mode=ro&uri=true"
 
-ADMIN_IDS = [580493054]
+DEFAULT_ADMIN_IDS = "580493054"
 WORKS_URL = "https://t.me/testworkmanic"
+PHONE_RE = re.compile(r"\+\d{10,15}")
+# время жизни кэшей ролей и рабочих дней, сек
+ROLES_TTL = 60
 
-os.makedirs(PROJECT_FOLDER, exist_ok=True)
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=1)
+def get_api_token() -> str:
+    token = os.getenv("BOT_TOKEN")
+    if not token:
+        raise RuntimeError("BOT_TOKEN not set")
+    return token
+
+
+# список админов можно переопределить: ADMIN_IDS="1,2,3";
+# без переменной — админ по умолчанию, с пустым/битым списком — не стартуем
+@lru_cache(maxsize=1)
+def get_admin_ids() -> frozenset:
+    ids, bad = set(), []
+    for x in os.getenv("ADMIN_IDS", DEFAULT_ADMIN_IDS).split(","):
+        x = x.strip()
+        if x.isdecimal():
+            ids.add(int(x))
+        elif x:
+            bad.append(x)
+    if bad:
+        logger.warning("ADMIN_IDS: пропущены некорректные значения %s", bad)
+    if not ids:
+        raise RuntimeError("ADMIN_IDS has no valid ids")
+    return frozenset(ids)
+
+
+def setup_logging() -> QueueListener:
+    # хендлеры только кладут запись в очередь, в stderr пишет отдельный поток
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, stream)
+    listener.start()
+    return listener
+
 # ================= BOT =================
-bot = Bot(API_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
 router = Router()
 dp.include_router(router)
 
+
+def make_bot_session() -> Optional[AiohttpSession]:
+    # orjson кодирует тела запросов к Bot API в разы быстрее stdlib json
+    if orjson is None:
+        return None
+    return AiohttpSession(
+        json_loads=orjson.loads,
+        json_dumps=lambda obj: orjson.dumps(obj).decode()
+    )
+
+
 # ================= DB =================
-engine = create_async_engine(
-    f"sqlite+aiosqlite:///{DB_FILE}",
-    echo=False
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
 )
 
+
+def _sqlite_write_pragmas(dbapi_connection, _):
+    # WAL: коммит = дописывание в -wal, читатели не ждут писателя
+    dbapi_connection.isolation_level = None
+    cur = dbapi_connection.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+
+def _sqlite_begin_immediate(conn):
+    # блокировка на запись берётся сразу — без дедлоков при апгрейде
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _sqlite_read_pragmas(dbapi_connection, _):
+    cur = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+
+# движки создаются при первом вызове и дальше переиспользуются в этом процессе
+@lru_cache(maxsize=1)
+def get_engine() -> AsyncEngine:
+    # один писатель (SQLite всё равно пишет по одному)
+    engine = create_async_engine(
+        DB_URL,
+        echo=False,
+        pool_size=1,
+        max_overflow=0,
+        connect_args={"timeout": 5}
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_write_pragmas)
+    event.listen(engine.sync_engine, "begin", _sqlite_begin_immediate)
+    return engine
+
+
+@lru_cache(maxsize=1)
+def get_read_engine() -> AsyncEngine:
+    engine = create_async_engine(
+        DB_READ_URL,
+        echo=False,
+        pool_size=os.cpu_count() or 4,
+        connect_args={"timeout": 5}
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_read_pragmas)
+    return engine
+
+
+# фабрики сессий — одни на процесс; движки к ним привязывает init_db()
+WriteSession = async_sessionmaker(class_=AsyncSession, expire_on_commit=False)
+ReadSession = async_sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
 # ================= MODELS =================
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    telegram_id: int
+    # все поиски пользователя идут по telegram_id
+    telegram_id: int = Field(index=True)
     name: Optional[str] = None
     phone: Optional[str] = None
     is_master: bool = False
@@ -71,6 +199,11 @@ class User(SQLModel, table=True):
 
 
 class MasterSchedule(SQLModel, table=True):
+    __table_args__ = (
+        # свободные слоты дня: поиск и сортировка по time прямо из индекса
+        Index("ix_schedule_master_date_avail", "master_id", "date", "is_available", "time"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     master_id: int
     date: str
@@ -79,6 +212,11 @@ class MasterSchedule(SQLModel, table=True):
 
 
 class MasterWeekday(SQLModel, table=True):
+    __table_args__ = (
+        # маска рабочих дней и переключение дня — по (master_id, weekday)
+        Index("ix_weekday_master_day", "master_id", "weekday"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     master_id: int
     weekday: int
@@ -86,6 +224,15 @@ class MasterWeekday(SQLModel, table=True):
 
 
 class Booking(SQLModel, table=True):
+    __table_args__ = (
+        # напоминания: статус + ближайшие даты
+        Index("ix_booking_status_date", "status", "date"),
+        # «Мои записи» клиента и мастера
+        Index("ix_booking_chat_status", "chat_id", "status"),
+        # записи мастера по порядку визитов — без сортировки во временном B-tree
+        Index("ix_booking_master_date", "master_id", "date", "time"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     chat_id: int
     client_name: str
@@ -111,6 +258,110 @@ class SalonInfo(SQLModel, table=True):
     text: str = "💈 Добро пожаловать в салон!"
 
 
+# ================= QUERIES =================
+# горячие запросы собираются один раз; SQLAlchemy кэширует их компиляцию
+SEL_MASTERS = select(User.telegram_id, User.name).where(User.is_master == True)
+SEL_ADMINS = select(User.telegram_id).where(User.is_admin == True)
+SEL_LAST_REVIEWS = (
+    select(Review.user_name, Review.text)
+    .order_by(Review.id.desc())
+    .limit(10)
+)
+INS_REVIEW = insert(Review)
+SEL_SALON_TEXT = select(SalonInfo.text).where(SalonInfo.id == 1)
+
+
+# ================= WRITE QUEUE =================
+class WriteQueue:
+    # независимые записи одного тика цикла коммитятся одной транзакцией
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def submit(self, stmt, params: Optional[dict] = None) -> int:
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((stmt, params, fut))
+        return await fut
+
+    async def run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # даём остальным корутинам этого тика докинуть свои записи
+            await asyncio.sleep(0)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.exception("Write batch failed")
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    async def _flush(self, batch):
+        results = []
+        async with get_engine().begin() as conn:
+            for stmt, params, fut in batch:
+                # savepoint: ошибка одной записи не откатывает соседние
+                try:
+                    async with conn.begin_nested():
+                        res = await conn.execute(stmt, params)
+                    results.append((fut, res.rowcount, None))
+                except Exception as e:
+                    results.append((fut, None, e))
+
+        for fut, rowcount, error in results:
+            if fut.done():
+                continue
+            if error:
+                fut.set_exception(error)
+            else:
+                fut.set_result(rowcount)
+
+
+write_queue = WriteQueue()
+
+
+# ================= SEND QUEUE =================
+class TgSender:
+    # общий лимит Telegram ~30 сообщений/с; в один чат — строго по очереди
+    def __init__(self, rate: int = 30):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._stamp = monotonic()
+        self._bucket = asyncio.Lock()
+        self._chats: WeakValueDictionary = WeakValueDictionary()
+
+    async def _take(self):
+        async with self._bucket:
+            while True:
+                now = monotonic()
+                self._tokens = min(
+                    self.rate, self._tokens + (now - self._stamp) * self.rate
+                )
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def send(self, chat_id: int, make):
+        # make — фабрика корутины, чтобы запрос создавался уже после токена
+        lock = self._chats.get(chat_id)
+        if lock is None:
+            lock = self._chats[chat_id] = asyncio.Lock()
+        async with lock:
+            await self._take()
+            return await make()
+
+    def message(self, bot: Bot, chat_id: int, text: str, **kwargs):
+        return self.send(chat_id, partial(bot.send_message, chat_id, text, **kwargs))
+
+
+sender = TgSender()
+
+
 # ================= HELPERS =================
 def reply_kb(rows):
     return ReplyKeyboardMarkup(
@@ -130,14 +381,17 @@ WEEKDAYS_RU = {
 }
 
 
+# одни и те же даты повторяются во всех списках и клавиатурах
+@lru_cache(maxsize=512)
 def format_date_ru(date_str: str) -> str:
     d = datetime.fromisoformat(date_str)
     return f"{d.day} {MONTHS_RU[d.month]} ({WEEKDAYS_RU[d.weekday()]})"
 
 
+@lru_cache(maxsize=512)
 def format_datetime_ru(date_str: str, time_str: str) -> str:
-    d = datetime.fromisoformat(date_str)
-    return f"{d.day} {MONTHS_RU[d.month]} {time_str}"
+    # день недели тут не нужен — число и месяц берём срезами "YYYY-MM-DD"
+    return f"{int(date_str[8:10])} {MONTHS_RU[int(date_str[5:7])]} {time_str}"
 
 
 
@@ -147,47 +401,193 @@ def inline_kb(pairs):
     )
 
 
-def gen_dates(days=14):
-    today = datetime.now(LOCAL_TZ).date()
-    return [(today + timedelta(days=i)).isoformat() for i in range(days)]
+# ================= KEYBOARDS =================
+# статические меню собираются один раз и переиспользуются
+BACK_KB = reply_kb([["⬅️ Назад"]])
+
+_MAIN_MENU_ROWS = [
+    ["📅 Записаться"],
+    ["📋 Мои записи"],
+    ["ℹ️ О салоне"],
+    ["⭐ Отзывы"],
+    ["📸 Наши работы"],
+]
+
+# главное меню по ролям: (is_master, is_admin) -> клавиатура
+MAIN_MENU_KB = {
+    (is_master, admin): reply_kb(
+        _MAIN_MENU_ROWS
+        + ([["🛠 Админ"]] if admin else [])
+        + ([["🧑‍🔧 Панель мастера"]] if is_master else [])
+    )
+    for is_master in (False, True)
+    for admin in (False, True)
+}
+
+BOOK_OR_BACK_KB = reply_kb([
+    ["📅 Записаться"],
+    ["⬅️ Назад"]
+])
+
+REVIEWS_MENU_KB = reply_kb([
+    ["✍️ Оставить отзыв"],
+    ["📖 Посмотреть отзывы"],
+    ["⬅️ Назад"]
+])
+
+ADMIN_MENU_KB = reply_kb([
+    ["➕ Добавить мастера"],
+    ["➖ Удалить мастера"],
+    ["✏️ О салоне"],
+    ["⬅️ Назад"]
+])
+
+MASTER_MENU_KB = reply_kb([
+    ["📋 Мои записи"],
+    ["🕒 Моё расписание"],
+    ["📅 Дни работы"],
+    ["✏️ Редактировать профиль"],
+    ["⬅️ Назад"]
+])
+
+MASTER_PROFILE_KB = reply_kb([
+    ["✏️ Изменить имя"],
+    ["📞 Изменить телефон"],
+    ["⬅️ Назад"]
+])
+
+WORKS_KB = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="🔗 Перейти в портфолио",
+                url=WORKS_URL
+            )
+        ]
+    ]
+)
+
+
+# ================= CALLBACK DATA =================
+# формат совпадает со старыми "bm:123" и т.п.; время содержит ":",
+# поэтому bt:/mst: по-прежнему разбираются вручную
+class MasterPick(CallbackData, prefix="bm"):
+    master_id: int
+
+
+class DatePick(CallbackData, prefix="bd"):
+    date: str
+
+
+class WeekdayToggle(CallbackData, prefix="wd"):
+    weekday: int
+
+
+class BookingConfirm(CallbackData, prefix="mc"):
+    booking_id: int
+
+
+class BookingCancel(CallbackData, prefix="mx"):
+    booking_id: int
+
+
+class ScheduleDay(CallbackData, prefix="msd"):
+    date: str
+
+
+# карточки записей: кнопки собираются сразу, без промежуточных списков
+def master_booking_kb(booking_id: int, pending: bool) -> InlineKeyboardMarkup:
+    cancel = [InlineKeyboardButton(text="❌ Отменить", callback_data=BookingCancel(booking_id=booking_id).pack())]
+    if not pending:
+        return InlineKeyboardMarkup(inline_keyboard=[cancel])
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Подтвердить", callback_data=BookingConfirm(booking_id=booking_id).pack())],
+        cancel
+    ])
+
+
+def client_booking_kb(booking_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="❌ Отменить запись", callback_data=f"cx:{booking_id}")]
+    ])
+
+
+@lru_cache(maxsize=2)
+def _dates_for(today, days: int) -> tuple:
+    wd = today.weekday()
+    return tuple(
+        ((today + timedelta(days=i)).isoformat(), (wd + i) % 7)
+        for i in range(days)
+    )
+
+
+def gen_dates(days=14) -> tuple:
+    # пары (дата ISO, weekday); список меняется раз в сутки — считаем раз в день
+    return _dates_for(datetime.now(LOCAL_TZ).date(), days)
+
+
+TIME_SLOTS = ("10:00", "11:00", "12:00", "13:00", "14:00", "15:00", "16:00", "17:00")
+
 
+def time_slots() -> tuple:
+    return TIME_SLOTS
 
-def time_slots():
-    return ["10:00", "11:00", "12:00", "13:00","14:00", "15:00", "16:00", "17:00"]
 
+# рабочие дни мастера — битовая маска по weekday(), из БД читаем один раз;
+# master_id -> (время чтения, маска), TTL — как у кэша ролей
+_weekday_masks: dict = {}
+# поколение кэша мастера: растёт при каждой инвалидации,
+# чтобы чтение, начатое до правки, не записало старую маску
+_weekday_gen: dict = {}
 
-async def is_day_enabled(master_id: int, date_str: str) -> bool:
-    weekday = datetime.fromisoformat(date_str).weekday()
-    async with AsyncSession(engine) as s:
+
+async def get_weekday_mask(master_id: int) -> int:
+    now = monotonic()
+    cached = _weekday_masks.get(master_id)
+    if cached is not None and now - cached[0] <= ROLES_TTL:
+        return cached[1]
+
+    gen = _weekday_gen.get(master_id, 0)
+    async with ReadSession() as s:
         res = await s.exec(
-            select(MasterWeekday).where(
+            select(MasterWeekday.weekday).where(
                 MasterWeekday.master_id == master_id,
-                MasterWeekday.weekday == weekday,
                 MasterWeekday.is_enabled == True
             )
         )
-        return res.first() is not None
+        mask = 0
+        for wd in res.all():
+            mask |= 1 << wd
+    if _weekday_gen.get(master_id, 0) == gen:
+        _weekday_masks[master_id] = (now, mask)
+    return mask
+
+
+def invalidate_weekdays(master_id: int):
+    _weekday_gen[master_id] = _weekday_gen.get(master_id, 0) + 1
+    _weekday_masks.pop(master_id, None)
 
 
 async def ensure_master_weekdays(master_id: int):
-    async with AsyncSession(engine) as s:
+    async with WriteSession.begin() as s:
         res = await s.exec(
-            select(MasterWeekday).where(
+            select(MasterWeekday.weekday).where(
                 MasterWeekday.master_id == master_id
             )
         )
-        existing = {d.weekday for d in res.all()}
-
-        for i in range(7):
-            if i not in existing:
-                s.add(
-                    MasterWeekday(
-                        master_id=master_id,
-                        weekday=i,
-                        is_enabled=(i < 5)
-                    )
-                )
-        await s.commit()
+        existing = set(res.all())
+
+        # недостающие дни — одним многострочным INSERT
+        missing = [
+            {"master_id": master_id, "weekday": i, "is_enabled": i < 5}
+            for i in range(7)
+            if i not in existing
+        ]
+        if missing:
+            await s.exec(insert(MasterWeekday).values(missing))
+
+    if len(existing) < 7:
+        invalidate_weekdays(master_id)
 
 def booking_status_ru(status: str) -> str:
     return {
@@ -197,6 +597,32 @@ def booking_status_ru(status: str) -> str:
     }.get(status, status)
 
 
+async def send_all(*sends) -> list:
+    # рассылка параллельно: сбой одного получателя не мешает остальным
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    for r in results:
+        if isinstance(r, Exception):
+            logger.error("Send failed", exc_info=r)
+    return results
+
+
+TG_TEXT_LIMIT = 4096
+
+
+def pack_messages(parts, sep: str = "\n\n") -> list:
+    # склеиваем короткие тексты в как можно меньше сообщений до лимита Telegram
+    messages, current = [], ""
+    for part in parts:
+        if current and len(current) + len(sep) + len(part) > TG_TEXT_LIMIT:
+            messages.append(current)
+            current = part
+        else:
+            current = f"{current}{sep}{part}" if current else part
+    if current:
+        messages.append(current)
+    return messages
+
+
 def booking_card(text: str) -> str:
     return (
         "━━━━━━━━━━━━━━\n"
@@ -205,24 +631,31 @@ def booking_card(text: str) -> str:
     )
 
 
-@router.callback_query(F.data.startswith("bm:"))
-async def booking_master(cb: CallbackQuery, state: FSMContext):
-    master_id = int(cb.data.split(":")[1])
-    await state.update_data(master=master_id)
+@lru_cache(maxsize=128)
+def _booking_dates_kb(dates: tuple, mask: int) -> Optional[InlineKeyboardMarkup]:
+    # у мастеров с одинаковыми рабочими днями клавиатура общая
+    pairs = [
+        (format_date_ru(d), DatePick(date=d).pack())
+        for d, wd in dates
+        if mask & (1 << wd)
+    ]
+    return inline_kb(pairs) if pairs else None
 
-    dates = []  # 🔥 ВОТ ЭТОГО НЕ ХВАТАЛО
 
-    for d in gen_dates():
-        if await is_day_enabled(master_id, d):
-            dates.append((format_date_ru(d), f"bd:{d}"))
+@router.callback_query(MasterPick.filter())
+async def booking_master(cb: CallbackQuery, callback_data: MasterPick, state: FSMContext):
+    master_id = callback_data.master_id
+    await state.update_data(master=master_id)
 
-    if not dates:
+    kb = _booking_dates_kb(gen_dates(), await get_weekday_mask(master_id))
+
+    if kb is None:
         await cb.answer("У мастера нет рабочих дней", show_alert=True)
         return
 
     await cb.message.answer(
         "Выберите дату:",
-        reply_markup=inline_kb(dates)
+        reply_markup=kb
     )
     await state.set_state(BookingFSM.date)
 
@@ -255,45 +688,81 @@ class MasterEditFSM(StatesGroup):
 
 
 # ================= HELPERS =================
-async def is_admin(uid: int) -> bool:
-    if uid in ADMIN_IDS:
-        return True
+# мастеров единицы, держим всю таблицу в памяти: telegram_id -> имя;
+# TTL (ROLES_TTL) — страховка на случай правок БД в обход бота
+_masters_cache: Optional[tuple] = None
+# поколение кэша, как у рабочих дней: чтение, начатое до правки, не сохраняем
+_masters_gen = 0
 
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(User).where(
-                User.telegram_id == uid,
-                User.is_admin == True
-            )
-        )
-        return res.first() is not None
 
+async def get_masters() -> dict:
+    global _masters_cache
+    now = monotonic()
+    if _masters_cache is not None and now - _masters_cache[0] <= ROLES_TTL:
+        return _masters_cache[1]
 
+    gen = _masters_gen
+    async with ReadSession() as s:
+        res = await s.exec(SEL_MASTERS)
+        masters = dict(res.all())
+    if _masters_gen == gen:
+        _masters_cache = (now, masters)
+    return masters
 
-# ================= START =================
-@router.message(Command("start"))
-async def start(msg: Message):
-    rows = [
-        ["📅 Записаться"],
-        ["📋 Мои записи"],
-        ["ℹ️ О салоне"],
-        ["⭐ Отзывы"],
-        ["📸 Наши работы"],
-    ]
 
-    if await is_admin(msg.from_user.id):
-        rows.append(["🛠 Админ"])
+def invalidate_masters():
+    global _masters_cache, _masters_gen
+    _masters_gen += 1
+    _masters_cache = None
 
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(User).where(
-                User.telegram_id == msg.from_user.id,
-                User.is_master == True
-            )
-        )
-        if res.first():
-            rows.append(["🧑‍🔧 Панель мастера"])
 
+# админы из БД (флаг ставится вручную) + get_admin_ids(), тоже одним набором
+_admins_cache: Optional[tuple] = None
+
+
+async def get_admins() -> frozenset:
+    global _admins_cache
+    now = monotonic()
+    if _admins_cache is None or now - _admins_cache[0] > ROLES_TTL:
+        async with ReadSession() as s:
+            res = await s.exec(SEL_ADMINS)
+            _admins_cache = (now, get_admin_ids() | frozenset(res.all()))
+    return _admins_cache[1]
+
+
+# текст «О салоне» меняет только админ через бота — держим его в памяти;
+# (text,) — чтобы отличать «ещё не читали» от «строки нет»
+_salon_text: Optional[tuple] = None
+
+
+async def get_salon_text() -> Optional[str]:
+    global _salon_text
+    if _salon_text is None:
+        async with ReadSession() as s:
+            text = (await s.exec(SEL_SALON_TEXT)).first()
+        # пока читали, админ мог уже сохранить новый текст — его не затираем
+        if _salon_text is None:
+            _salon_text = (text,)
+    return _salon_text[0]
+
+
+def set_salon_text(text: str):
+    global _salon_text
+    _salon_text = (text,)
+
+
+async def get_user_roles(uid: int) -> tuple:
+    # (is_master, is_admin) — проверка по наборам в памяти, без запроса
+    return uid in await get_masters(), uid in await get_admins()
+
+
+async def is_admin(uid: int) -> bool:
+    return uid in get_admin_ids() or uid in await get_admins()
+
+
+# ================= START =================
+@router.message(Command("start"))
+async def start(msg: Message):
     await msg.answer(
         "💈 Маникюрный салон\n\n"
         "Онлайн-запись к мастерам:\n"
@@ -301,7 +770,7 @@ async def start(msg: Message):
         "• подтверждение записи\n"
         "• автоматические напоминания\n\n"
         "Выберите действие ниже 👇",
-        reply_markup=reply_kb(rows)
+        reply_markup=MAIN_MENU_KB[await get_user_roles(msg.from_user.id)]
     )
 
 
@@ -311,11 +780,7 @@ async def start(msg: Message):
 async def reviews_menu(msg: Message):
     await msg.answer(
         "⭐ Отзывы",
-        reply_markup=reply_kb([
-            ["✍️ Оставить отзыв"],
-            ["📖 Посмотреть отзывы"],
-            ["⬅️ Назад"]
-        ])
+        reply_markup=REVIEWS_MENU_KB
     )
 
 
@@ -327,51 +792,48 @@ async def review_start(msg: Message, state: FSMContext):
 
 @router.message(StateFilter(ReviewFSM.text))
 async def review_save(msg: Message, state: FSMContext):
-    async with AsyncSession(engine) as s:
-        s.add(
-            Review(
-                user_id=msg.from_user.id,
-                user_name=msg.from_user.full_name,
-                text=msg.text
-            )
-        )
-        await s.commit()
+    await write_queue.submit(
+        INS_REVIEW,
+        {
+            "user_id": msg.from_user.id,
+            "user_name": msg.from_user.full_name,
+            "text": msg.text
+        }
+    )
 
     await msg.answer(
         "✅ Спасибо за отзыв!",
-        reply_markup=reply_kb([["⬅️ Назад"]])
+        reply_markup=BACK_KB
     )
     await state.clear()
 
 
 @router.message(F.text == "📖 Посмотреть отзывы")
 async def reviews_show(msg: Message):
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(Review).order_by(Review.id.desc()).limit(10)
-        )
+    async with ReadSession() as s:
+        res = await s.exec(SEL_LAST_REVIEWS)
         reviews = res.all()
 
     if not reviews:
         await msg.answer("Пока отзывов нет 😔")
         return
 
-    for r in reviews:
-        await msg.answer(
-            f"⭐ {r.user_name or 'Клиент'}:\n{r.text}"
-        )
+    # последние отзывы одним-двумя сообщениями вместо десяти
+    for text in pack_messages(
+        f"⭐ {r.user_name or 'Клиент'}:\n{r.text}" for r in reviews
+    ):
+        await sender.send(msg.chat.id, partial(msg.answer, text))
 
 
 @router.message(F.text == "ℹ️ О салоне")
 async def show_salon_info(msg: Message):
-    async with AsyncSession(engine) as s:
-        info = await s.get(SalonInfo, 1)
-
-    text = info.text if info else "Информация о салоне пока не добавлена."
+    text = await get_salon_text()
+    if text is None:
+        text = "Информация о салоне пока не добавлена."
 
     await msg.answer(
         text,
-        reply_markup=reply_kb([["⬅️ Назад"]])
+        reply_markup=BACK_KB
     )
 
 @router.message(F.text == "📸 Наши работы")
@@ -379,16 +841,7 @@ async def show_works(msg: Message):
     await msg.answer(
         "📸 Наши работы\n\n"
         "Смотрите примеры работ в нашем Telegram-канале 👇",
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="🔗 Перейти в портфолио",
-                        url=WORKS_URL
-                    )
-                ]
-            ]
-        )
+        reply_markup=WORKS_KB
     )
 
 
@@ -400,12 +853,7 @@ async def admin_panel(msg: Message):
 
     await msg.answer(
         "🛠 Админ панель",
-        reply_markup=reply_kb([
-            ["➕ Добавить мастера"],
-            ["➖ Удалить мастера"],
-            ["✏️ О салоне"],
-            ["⬅️ Назад"]
-        ])
+        reply_markup=ADMIN_MENU_KB
     )
 
 
@@ -416,9 +864,9 @@ async def admin_edit_salon(msg: Message, state: FSMContext):
     if not await is_admin(msg.from_user.id):
         return
 
-    async with AsyncSession(engine) as s:
-        info = await s.get(SalonInfo, 1)
-        text = info.text if info else "Информация не задана"
+    text = await get_salon_text()
+    if text is None:
+        text = "Информация не задана"
 
     await msg.answer(
         f"✏️ Текущий текст:\n\n{text}\n\nВведите новый:",
@@ -430,15 +878,16 @@ async def admin_edit_salon(msg: Message, state: FSMContext):
 
 @router.message(StateFilter(SalonEditFSM.text))
 async def admin_save_salon(msg: Message, state: FSMContext):
-    async with AsyncSession(engine) as s:
-        info = await s.get(SalonInfo, 1)
-        if info:
-            info.text = msg.text
-        else:
-            s.add(SalonInfo(id=1, text=msg.text))
-        await s.commit()
+    # upsert одной командой вместо чтения строки и правки объекта
+    stmt = sqlite_insert(SalonInfo).values(id=1, text=msg.text)
+    await write_queue.submit(
+        stmt.on_conflict_do_update(
+            index_elements=[SalonInfo.id], set_={"text": stmt.excluded.text}
+        )
+    )
+    set_salon_text(msg.text)
 
-    await msg.answer("✅ Обновлено", reply_markup=reply_kb([["⬅️ Назад"]]))
+    await msg.answer("✅ Обновлено", reply_markup=BACK_KB)
     await state.clear()
 
 
@@ -460,7 +909,7 @@ async def admin_add_master_save(msg: Message, state: FSMContext):
         await msg.answer("❌ Нужно число")
         return
 
-    async with AsyncSession(engine) as s:
+    async with WriteSession.begin() as s:
         res = await s.exec(select(User).where(User.telegram_id == tg_id))
         user = res.first()
 
@@ -469,12 +918,17 @@ async def admin_add_master_save(msg: Message, state: FSMContext):
         else:
             s.add(User(telegram_id=tg_id, is_master=True))
 
-        for wd in range(5):
-            s.add(MasterWeekday(master_id=tg_id, weekday=wd, is_enabled=True))
+        await s.exec(
+            insert(MasterWeekday).values([
+                {"master_id": tg_id, "weekday": wd, "is_enabled": True}
+                for wd in range(5)
+            ])
+        )
 
-        await s.commit()
+    invalidate_masters()
+    invalidate_weekdays(tg_id)
 
-    await msg.answer("✅ Мастер добавлен", reply_markup=reply_kb([["⬅️ Назад"]]))
+    await msg.answer("✅ Мастер добавлен", reply_markup=BACK_KB)
     await state.clear()
 
 
@@ -494,32 +948,34 @@ async def admin_remove_master_save(msg: Message, state: FSMContext):
         await msg.answer("❌ Нужно число")
         return
 
-    async with AsyncSession(engine) as s:
+    async with WriteSession.begin() as s:
+        # снимаем роль мастера; нет строки — значит, это не мастер
         res = await s.exec(
-            select(User).where(User.telegram_id == tg_id)
+            update(User)
+            .where(User.telegram_id == tg_id, User.is_master == True)
+            .values(is_master=False)
         )
-        user = res.first()
-
-        if not user or not user.is_master:
-            await msg.answer("❌ Этот пользователь не является мастером")
-            return
+        removed = res.rowcount > 0
 
-        # снимаем роль мастера
-        user.is_master = False
+        if removed:
+            # удаляем расписание и дни
+            await s.exec(
+                delete(MasterSchedule).where(MasterSchedule.master_id == tg_id)
+            )
+            await s.exec(
+                delete(MasterWeekday).where(MasterWeekday.master_id == tg_id)
+            )
 
-        # удаляем расписание и дни
-        await s.exec(
-            delete(MasterSchedule).where(MasterSchedule.master_id == tg_id)
-        )
-        await s.exec(
-            delete(MasterWeekday).where(MasterWeekday.master_id == tg_id)
-        )
+    if not removed:
+        await msg.answer("❌ Этот пользователь не является мастером")
+        return
 
-        await s.commit()
+    invalidate_masters()
+    invalidate_weekdays(tg_id)
 
     await msg.answer(
         "✅ Мастер удалён",
-        reply_markup=reply_kb([["⬅️ Назад"]])
+        reply_markup=BACK_KB
     )
     await state.clear()
 
@@ -532,20 +988,13 @@ async def back(msg: Message, state: FSMContext):
     await start(msg)
 
 # ================= TIMEZONE =================
-from zoneinfo import ZoneInfo
-
-IRKUTSK_TZ = ZoneInfo("Asia/Irkutsk")
-
-
 def now_irkutsk() -> datetime:
-    return datetime.now(IRKUTSK_TZ)
+    return datetime.now(LOCAL_TZ)
 
 
-def is_time_future(date_str: str, time_str: str) -> bool:
-    dt = datetime.strptime(
-        f"{date_str} {time_str}", "%Y-%m-%d %H:%M"
-    ).replace(tzinfo=IRKUTSK_TZ)
-    return dt > now_irkutsk()
+@lru_cache(maxsize=1024)
+def parse_visit(date_str: str, time_str: str) -> datetime:
+    return datetime.fromisoformat(f"{date_str} {time_str}").replace(tzinfo=LOCAL_TZ)
 
 
 # ================= BOOKING =================
@@ -564,29 +1013,27 @@ async def booking_name(msg: Message, state: FSMContext):
 
 @router.message(StateFilter(BookingFSM.phone))
 async def booking_phone(msg: Message, state: FSMContext):
-    if not re.fullmatch(r"\+\d{10,15}", msg.text):
+    if not PHONE_RE.fullmatch(msg.text):
         await msg.answer("❌ Неверный формат")
         return
 
     await state.update_data(phone=msg.text)
 
-    async with AsyncSession(engine) as s:
-        res = await s.exec(select(User).where(User.is_master == True))
-        masters = res.all()
+    masters = await get_masters()
 
     await msg.answer(
         "Выберите мастера:",
         reply_markup=inline_kb([
-            (m.name or f"ID {m.telegram_id}", f"bm:{m.telegram_id}")
-            for m in masters
+            (name or f"ID {tg_id}", MasterPick(master_id=tg_id).pack())
+            for tg_id, name in masters.items()
         ])
     )
     await state.set_state(BookingFSM.master)
 
 
 # ================= SELECT DATE =================
-@router.callback_query(F.data.startswith("bd:"))
-async def booking_date(cb: CallbackQuery, state: FSMContext):
+@router.callback_query(DatePick.filter())
+async def booking_date(cb: CallbackQuery, callback_data: DatePick, state: FSMContext):
     data = await state.get_data()
 
     if "master" not in data:
@@ -596,32 +1043,35 @@ async def booking_date(cb: CallbackQuery, state: FSMContext):
         )
         return
 
-    date = cb.data.split(":")[1]
+    date = callback_data.date
 
-    async with AsyncSession(engine) as s:
+    async with ReadSession() as s:
         res = await s.exec(
-            select(MasterSchedule).where(
+            select(MasterSchedule.time).where(
                 MasterSchedule.master_id == data["master"],
                 MasterSchedule.date == date,
                 MasterSchedule.is_available == True
-            )
+            ).order_by(MasterSchedule.time)
         )
-        slots = res.all()  # ✅ ВОТ ЭТОГО НЕ ХВАТАЛО
+        times = res.all()
 
-    # ✅ сортировка по времени
-    slots = sorted(slots, key=lambda s: s.time)
+    # "сейчас" считаем один раз; HH:MM сравниваются как строки
+    now = now_irkutsk()
+    today = now.date().isoformat()
+    if date < today:
+        times = []
+    elif date == today:
+        now_hm = now.strftime("%H:%M")
+        times = [t for t in times if t > now_hm]
 
-    valid_slots = [
-        (s.time, f"bt:{s.time}")
-        for s in slots
-        if is_time_future(date, s.time)
-    ]
+    valid_slots = [(t, f"bt:{t}") for t in times]
 
     if not valid_slots:
         await cb.answer("Нет доступного времени", show_alert=True)
         return
 
-    await state.update_data(date=date)
+    # запоминаем предложенное время — выбор проверим без лишнего запроса
+    await state.update_data(date=date, times=[t for t, _ in valid_slots])
 
     await cb.message.answer(
         f"⏰ {format_date_ru(date)}",
@@ -631,7 +1081,7 @@ async def booking_date(cb: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("bt:"))
-async def booking_time(cb: CallbackQuery, state: FSMContext):
+async def booking_time(cb: CallbackQuery, state: FSMContext, bot: Bot):
     data = await state.get_data()
 
     if "master" not in data or "date" not in data:
@@ -641,54 +1091,64 @@ async def booking_time(cb: CallbackQuery, state: FSMContext):
         )
         return
 
-    time = cb.data.split(":", 1)[1]
+    time = cb.data[len("bt:"):]
     master_id = data["master"]
     date = data["date"]
 
-    async with AsyncSession(engine) as s:
+    offered = data.get("times")
+    if offered is not None and time not in offered:
+        await cb.answer("⛔ Это время уже занято", show_alert=True)
+        return
+
+    async with WriteSession.begin() as s:
+        # слот занимает тот, чей DELETE его удалил — без отдельного SELECT
         res = await s.exec(
-            select(MasterSchedule).where(
+            delete(MasterSchedule).where(
                 MasterSchedule.master_id == master_id,
                 MasterSchedule.date == date,
-                MasterSchedule.time == time
+                MasterSchedule.time == time,
+                MasterSchedule.is_available == True
             )
         )
-        slot = res.first()
-
-        if not slot:
-            await cb.answer("⛔ Это время уже занято", show_alert=True)
-            return
+        claimed = res.rowcount > 0
+
+        if claimed:
+            # прямой INSERT без объекта ORM и unit of work
+            await s.exec(
+                insert(Booking).values(
+                    chat_id=cb.from_user.id,
+                    client_name=data["name"],
+                    phone=data["phone"],
+                    date=date,
+                    time=time,
+                    master_id=master_id,
+                    status="pending"
+                )
+            )
 
-        await s.delete(slot)
+    if not claimed:
+        await cb.answer("⛔ Это время уже занято", show_alert=True)
+        return
 
-        booking = Booking(
-            chat_id=cb.from_user.id,
-            client_name=data["name"],
-            phone=data["phone"],
-            date=date,
-            time=time,
-            master_id=master_id,
-            status="pending"
+    await send_all(
+        # 🔔 мастеру
+        sender.message(
+            bot,
+            master_id,
+            "📅 Новая запись\n\n"
+            f"🗓 {format_datetime_ru(date, time)}\n"
+            f"👤 {data['name']}\n"
+            f"📞 {data['phone']}\n\n"
+            "⏳ Ожидает подтверждения"
+        ),
+        # ✅ клиенту
+        sender.message(
+            bot,
+            cb.from_user.id,
+            "⏳ Заявка отправлена мастеру\n\n"
+            f"🗓 {format_datetime_ru(date, time)}\n"
+            "Мастер подтвердит запись в ближайшее время."
         )
-        s.add(booking)
-        await s.commit()
-
-    # 🔔 мастеру
-    await bot.send_message(
-        master_id,
-        "📅 Новая запись\n\n"
-        f"🗓 {format_datetime_ru(date, time)}\n"
-        f"👤 {data['name']}\n"
-        f"📞 {data['phone']}\n\n"
-        "⏳ Ожидает подтверждения"
-    )
-
-    # ✅ клиенту
-    await bot.send_message(
-        cb.from_user.id,
-        "⏳ Заявка отправлена мастеру\n\n"
-        f"🗓 {format_datetime_ru(date, time)}\n"
-        "Мастер подтвердит запись в ближайшее время."
     )
 
     await cb.answer()
@@ -703,13 +1163,7 @@ async def booking_time(cb: CallbackQuery, state: FSMContext):
 async def master_panel(msg: Message):
     await msg.answer(
         "🧑‍🔧 Панель мастера",
-        reply_markup=reply_kb([
-            ["📋 Мои записи"],
-            ["🕒 Моё расписание"],
-            ["📅 Дни работы"],
-            ["✏️ Редактировать профиль"],
-            ["⬅️ Назад"]
-        ])
+        reply_markup=MASTER_MENU_KB
     )
 
 @router.message(F.text == "📅 Дни работы")
@@ -738,39 +1192,31 @@ WEEKDAYS = [
 ]
 
 async def build_weekdays_keyboard(master_id: int) -> InlineKeyboardMarkup:
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(MasterWeekday).where(
-                MasterWeekday.master_id == master_id
-            )
-        )
-        days = {d.weekday: d.is_enabled for d in res.all()}
+    mask = await get_weekday_mask(master_id)
 
     buttons = []
     for i, name in enumerate(WEEKDAYS):
-        enabled = days.get(i, False)
-        mark = "✅" if enabled else "❌"
-        buttons.append((f"{mark} {name}", f"wd:{i}"))
+        mark = "✅" if mask & (1 << i) else "❌"
+        buttons.append((f"{mark} {name}", WeekdayToggle(weekday=i).pack()))
 
     return inline_kb(buttons)
 
 
-@router.callback_query(F.data.startswith("wd:"))
-async def toggle_weekday(cb: CallbackQuery):
-    weekday = int(cb.data.split(":")[1])
+@router.callback_query(WeekdayToggle.filter())
+async def toggle_weekday(cb: CallbackQuery, callback_data: WeekdayToggle):
+    weekday = callback_data.weekday
     master_id = cb.from_user.id
 
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(MasterWeekday).where(
-                MasterWeekday.master_id == master_id,
-                MasterWeekday.weekday == weekday
-            )
+    # переключаем прямо в БД, без чтения строки
+    await write_queue.submit(
+        update(MasterWeekday)
+        .where(
+            MasterWeekday.master_id == master_id,
+            MasterWeekday.weekday == weekday
         )
-        day = res.first()
-        if day:
-            day.is_enabled = not day.is_enabled
-        await s.commit()
+        .values(is_enabled=not_(MasterWeekday.is_enabled))
+    )
+    invalidate_weekdays(master_id)
 
     # ✅ ШАГ 2 ВОТ ЗДЕСЬ
     kb = await build_weekdays_keyboard(master_id)
@@ -778,36 +1224,33 @@ async def toggle_weekday(cb: CallbackQuery):
     await cb.answer("Обновлено")
 
 
-from sqlalchemy import and_
-
 @router.message(F.text == "📋 Мои записи")
 async def my_bookings(msg: Message):
     user_id = msg.from_user.id
 
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(User).where(User.telegram_id == user_id)
-        )
-        user = res.first()
+    is_master, _ = await get_user_roles(user_id)
 
-        is_master = bool(user and user.is_master)
-
-        # ===== ШАПКА =====
-        if is_master:
-            await msg.answer(
-                "🧑‍🔧 Записи клиентов\n"
-                "──────────────"
-            )
-        else:
-            await msg.answer(
-                "📋 Мои записи\n"
-                "──────────────"
-            )
+    # ===== ШАПКА =====
+    if is_master:
+        await msg.answer(
+            "🧑‍🔧 Записи клиентов\n"
+            "──────────────"
+        )
+    else:
+        await msg.answer(
+            "📋 Мои записи\n"
+            "──────────────"
+        )
 
-        # ===== МАСТЕР =====
-        if is_master:
+    # ===== МАСТЕР =====
+    if is_master:
+        # только нужные колонки; соединение отпускаем до рассылки карточек
+        async with ReadSession() as s:
             res = await s.exec(
-                select(Booking)
+                select(
+                    Booking.id, Booking.client_name, Booking.phone,
+                    Booking.date, Booking.time, Booking.status
+                )
                 .where(
                     and_(
                         Booking.master_id == user_id,
@@ -818,36 +1261,35 @@ async def my_bookings(msg: Message):
             )
             bookings = res.all()
 
-            if not bookings:
-                await msg.answer(
-                    "📭 У вас пока нет записей\n\n"
-                    "Когда клиент запишется — запись появится здесь.",
-                    reply_markup=reply_kb([["⬅️ Назад"]])
-                )
-                return
-
-            for b in bookings:
-                buttons = []
-
-                if b.status == "pending":
-                    buttons.append(("✅ Подтвердить", f"mc:{b.id}"))
-
-                buttons.append(("❌ Отменить", f"mx:{b.id}"))
-
-                await msg.answer(
-                    booking_card(
-                        f"📅 {format_datetime_ru(b.date, b.time)}\n"
-                        f"👤 Клиент: {b.client_name}\n"
-                        f"📞 {b.phone}\n"
-                        f"📌 Статус: {booking_status_ru(b.status)}"
-                    ),
-                    reply_markup=inline_kb(buttons)
-                )
+        if not bookings:
+            await msg.answer(
+                "📭 У вас пока нет записей\n\n"
+                "Когда клиент запишется — запись появится здесь.",
+                reply_markup=BACK_KB
+            )
+            return
 
-        # ===== КЛИЕНТ =====
-        else:
+        for b in bookings:
+            await sender.send(msg.chat.id, partial(
+                msg.answer,
+                booking_card(
+                    f"📅 {format_datetime_ru(b.date, b.time)}\n"
+                    f"👤 Клиент: {b.client_name}\n"
+                    f"📞 {b.phone}\n"
+                    f"📌 Статус: {booking_status_ru(b.status)}"
+                ),
+                reply_markup=master_booking_kb(b.id, b.status == "pending")
+            ))
+
+    # ===== КЛИЕНТ =====
+    else:
+        # только нужные колонки, без ORM-объектов Booking/User
+        async with ReadSession() as s:
             res = await s.exec(
-                select(Booking, User)
+                select(
+                    Booking.id, Booking.date, Booking.time, Booking.status,
+                    User.name
+                )
                 .join(User, User.telegram_id == Booking.master_id)
                 .where(
                     and_(
@@ -859,28 +1301,24 @@ async def my_bookings(msg: Message):
             )
             rows = res.all()
 
-            if not rows:
-                await msg.answer(
-                    "📭 У вас пока нет активных записей\n\n"
-                    "Запишитесь к мастеру в любое удобное время 👇",
-                    reply_markup=reply_kb([
-                        ["📅 Записаться"],
-                        ["⬅️ Назад"]
-                    ])
-                )
-                return
-
-            for b, master in rows:
-                await msg.answer(
-                    booking_card(
-                        f"📅 {format_datetime_ru(b.date, b.time)}\n"
-                        f"👨‍🔧 Мастер: {master.name or 'Без имени'}\n"
-                        f"📌 Статус: {booking_status_ru(b.status)}"
-                    ),
-                    reply_markup=inline_kb([
-                        ("❌ Отменить запись", f"cx:{b.id}")
-                    ])
-                )
+        if not rows:
+            await msg.answer(
+                "📭 У вас пока нет активных записей\n\n"
+                "Запишитесь к мастеру в любое удобное время 👇",
+                reply_markup=BOOK_OR_BACK_KB
+            )
+            return
+
+        for bid, date, time, status, master_name in rows:
+            await sender.send(msg.chat.id, partial(
+                msg.answer,
+                booking_card(
+                    f"📅 {format_datetime_ru(date, time)}\n"
+                    f"👨‍🔧 Мастер: {master_name or 'Без имени'}\n"
+                    f"📌 Статус: {booking_status_ru(status)}"
+                ),
+                reply_markup=client_booking_kb(bid)
+            ))
 
 
 
@@ -888,26 +1326,13 @@ async def my_bookings(msg: Message):
 
 @router.message(F.text == "✏️ Редактировать профиль")
 async def master_edit_profile(msg: Message):
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(User).where(
-                User.telegram_id == msg.from_user.id,
-                User.is_master == True
-            )
-        )
-        user = res.first()
-
-    if not user:
+    if msg.from_user.id not in await get_masters():
         await msg.answer("⛔ Нет доступа")
         return
 
     await msg.answer(
         "✏️ Редактирование профиля",
-        reply_markup=reply_kb([
-            ["✏️ Изменить имя"],
-            ["📞 Изменить телефон"],
-            ["⬅️ Назад"]
-        ])
+        reply_markup=MASTER_PROFILE_KB
     )
 
 
@@ -919,16 +1344,15 @@ async def master_edit_name(msg: Message, state: FSMContext):
 
 @router.message(StateFilter(MasterEditFSM.name))
 async def master_save_name(msg: Message, state: FSMContext):
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(User).where(User.telegram_id == msg.from_user.id)
-        )
-        user = res.first()
-        if user:
-            user.name = msg.text
-            await s.commit()
+    await write_queue.submit(
+        update(User)
+        .where(User.telegram_id == msg.from_user.id)
+        .values(name=msg.text)
+    )
+
+    invalidate_masters()
 
-    await msg.answer("✅ Имя обновлено", reply_markup=reply_kb([["⬅️ Назад"]]))
+    await msg.answer("✅ Имя обновлено", reply_markup=BACK_KB)
     await state.clear()
 
 
@@ -940,51 +1364,51 @@ async def master_edit_phone(msg: Message, state: FSMContext):
 
 @router.message(StateFilter(MasterEditFSM.phone))
 async def master_save_phone(msg: Message, state: FSMContext):
-    if not re.fullmatch(r"\+\d{10,15}", msg.text):
+    if not PHONE_RE.fullmatch(msg.text):
         await msg.answer("❌ Неверный формат телефона")
         return
 
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(User).where(User.telegram_id == msg.from_user.id)
-        )
-        user = res.first()
-        if user:
-            user.phone = msg.text
-            await s.commit()
+    await write_queue.submit(
+        update(User)
+        .where(User.telegram_id == msg.from_user.id)
+        .values(phone=msg.text)
+    )
 
-    await msg.answer("✅ Телефон обновлён", reply_markup=reply_kb([["⬅️ Назад"]]))
+    await msg.answer("✅ Телефон обновлён", reply_markup=BACK_KB)
     await state.clear()
 
 
-@router.callback_query(F.data.startswith("mc:"))
-async def master_confirm(cb: CallbackQuery):
-    booking_id = int(cb.data.split(":")[1])
+@router.callback_query(BookingConfirm.filter())
+async def master_confirm(cb: CallbackQuery, callback_data: BookingConfirm, bot: Bot):
+    booking_id = callback_data.booking_id
 
-    async with AsyncSession(engine) as s:
+    # один UPDATE ... RETURNING вместо SELECT + изменения объекта
+    async with WriteSession.begin() as s:
         res = await s.exec(
-            select(Booking).where(Booking.id == booking_id)
+            update(Booking)
+            .where(Booking.id == booking_id, Booking.status != "confirmed")
+            .values(status="confirmed")
+            .returning(Booking.chat_id, Booking.date, Booking.time)
         )
-        b = res.first()
-
-        if not b:
-            await cb.answer("Запись не найдена", show_alert=True)
-            return
-
-        if b.status == "confirmed":
+        row = res.first()
+
+    if row is None:
+        # промах — редкий путь, тут уже можно уточнить причину
+        async with ReadSession() as s:
+            found = (await s.exec(
+                select(Booking.id).where(Booking.id == booking_id).limit(1)
+            )).first()
+        if found is not None:
             await cb.answer("Уже подтверждена")
-            return
-
-        # ✅ СОХРАНЯЕМ ДАННЫЕ ДО commit
-        chat_id = b.chat_id
-        date = b.date
-        time = b.time
+        else:
+            await cb.answer("Запись не найдена", show_alert=True)
+        return
 
-        b.status = "confirmed"
-        await s.commit()
+    chat_id, date, time = row
 
     # 🔔 уведомляем клиента (ВНЕ сессии, но с сохранёнными данными)
-    await bot.send_message(
+    await sender.message(
+        bot,
         chat_id,
         "✅ Ваша запись подтверждена!\n\n"
         f"🗓 {format_datetime_ru(date, time)}"
@@ -992,46 +1416,44 @@ async def master_confirm(cb: CallbackQuery):
 
     await cb.answer("Подтверждено")
 
-@router.callback_query(F.data.startswith("mx:"))
-async def master_cancel(cb: CallbackQuery):
-    booking_id = int(cb.data.split(":")[1])
+@router.callback_query(BookingCancel.filter())
+async def master_cancel(cb: CallbackQuery, callback_data: BookingCancel, bot: Bot):
+    booking_id = callback_data.booking_id
 
-    async with AsyncSession(engine) as s:
+    async with WriteSession.begin() as s:
         res = await s.exec(
-            select(Booking).where(
+            update(Booking)
+            .where(
                 Booking.id == booking_id,
                 Booking.status.in_(["pending", "confirmed"])
             )
+            .values(status="cancelled")
+            .returning(Booking.chat_id, Booking.date, Booking.time, Booking.master_id)
         )
-        b = res.first()
-
-        if not b:
-            await cb.answer("Запись не найдена", show_alert=True)
-            return
-
-        chat_id = b.chat_id
-        date = b.date
-        time = b.time
-        master_id = b.master_id
+        row = res.first()
 
-        b.status = "cancelled"
+        if row is not None:
+            chat_id, date, time, master_id = row
 
-        # возвращаем слот
-        s.add(
-            MasterSchedule(
-                master_id=master_id,
-                date=date,
-                time=time,
-                is_available=True
+            # возвращаем слот
+            await s.exec(
+                insert(MasterSchedule).values(
+                    master_id=master_id,
+                    date=date,
+                    time=time,
+                    is_available=True
+                )
             )
-        )
 
-        await s.commit()
+    if row is None:
+        await cb.answer("Запись не найдена", show_alert=True)
+        return
 
     await cb.message.delete()
     await cb.answer("Запись отменена")
 
-    await bot.send_message(
+    await sender.message(
+        bot,
         chat_id,
         f"❌ Ваша запись отменена мастером\n\n🗓 {format_datetime_ru(date, time)}"
     )
@@ -1039,21 +1461,24 @@ async def master_cancel(cb: CallbackQuery):
 
 # ================= MASTER SCHEDULE FIX =================
 
+@lru_cache(maxsize=1)
+def _schedule_dates_kb(dates: tuple) -> InlineKeyboardMarkup:
+    return inline_kb([(format_date_ru(d), ScheduleDay(date=d).pack()) for d, _ in dates])
+
+
 @router.message(F.text == "🕒 Моё расписание")
 async def master_schedule(msg: Message):
     await msg.answer(
         "📅 Выберите дату:",
-        reply_markup=inline_kb([
-            (format_date_ru(d), f"msd:{d}") for d in gen_dates()
-        ])
+        reply_markup=_schedule_dates_kb(gen_dates())
     )
 
 
-@router.callback_query(F.data.startswith("msd:"))
-async def master_schedule_day(cb: CallbackQuery):
-    date = cb.data.split(":")[1]
+@router.callback_query(ScheduleDay.filter())
+async def master_schedule_day(cb: CallbackQuery, callback_data: ScheduleDay):
+    date = callback_data.date
 
-    async with AsyncSession(engine) as s:
+    async with ReadSession() as s:
         res = await s.exec(
             select(MasterSchedule).where(
                 MasterSchedule.master_id == cb.from_user.id,
@@ -1078,42 +1503,43 @@ async def master_schedule_day(cb: CallbackQuery):
 
 @router.callback_query(F.data.startswith("mst:"))
 async def master_toggle_slot(cb: CallbackQuery):
-    _, date, time = cb.data.split(":", 2)
+    # "mst:YYYY-MM-DD:HH:MM" — поля фиксированной длины, режем срезами
+    date, time = cb.data[4:14], cb.data[15:]
 
-    async with AsyncSession(engine) as s:
+    # весь день одним запросом: и переключение, и кнопки из одной выборки
+    async with WriteSession.begin() as s:
         res = await s.exec(
-            select(MasterSchedule).where(
+            select(MasterSchedule.time, MasterSchedule.is_available).where(
                 MasterSchedule.master_id == cb.from_user.id,
-                MasterSchedule.date == date,
-                MasterSchedule.time == time
+                MasterSchedule.date == date
             )
         )
-        slot = res.first()
-
-        if slot:
-            if slot.is_available:
-                await s.delete(slot)
-        else:
-            s.add(
-                MasterSchedule(
+        # строк на одно время может быть несколько — слот открыт, если открыта любая
+        slots = {}
+        for t, is_available in res.all():
+            slots[t] = slots.get(t, False) or is_available
+
+        if time not in slots:
+            await s.exec(
+                insert(MasterSchedule).values(
                     master_id=cb.from_user.id,
                     date=date,
                     time=time,
                     is_available=True
                 )
             )
-
-        await s.commit()
-
-    # обновляем кнопки
-    async with AsyncSession(engine) as s:
-        res = await s.exec(
-            select(MasterSchedule).where(
-                MasterSchedule.master_id == cb.from_user.id,
-                MasterSchedule.date == date
+            slots[time] = True
+        elif slots[time]:
+            # закрываем слот целиком, вместе с дублями
+            await s.exec(
+                delete(MasterSchedule).where(
+                    MasterSchedule.master_id == cb.from_user.id,
+                    MasterSchedule.date == date,
+                    MasterSchedule.time == time,
+                    MasterSchedule.is_available == True
+                )
             )
-        )
-        slots = {r.time: r.is_available for r in res.all()}
+            slots[time] = False
 
     buttons = []
     for t in time_slots():
@@ -1127,43 +1553,138 @@ async def master_toggle_slot(cb: CallbackQuery):
 
 
 # ================= REMINDERS =================
-async def reminder_loop():
+REMINDER_INTERVAL = timedelta(minutes=10)
+REMINDER_BATCH = 25
+# повтор неудачной отправки — окна 24ч/2ч длятся всего 10 минут
+REMINDER_RETRY = timedelta(minutes=1)
+
+
+async def reminder_loop(bot: Bot):
     while True:
         now = now_irkutsk()
-
-        async with AsyncSession(engine) as s:
+        # когда проснуться: к ближайшему входу в окно, но не позже интервала
+        next_due = now + REMINDER_INTERVAL
+        # границы окна — строки "YYYY-MM-DD HH:MM", сравниваются лексикографически:
+        # раньше окна 2ч напоминать уже нечего, позже 24ч + интервал — ещё рано
+        lo = now + timedelta(hours=1, minutes=50)
+        hi = now + timedelta(hours=24) + REMINDER_INTERVAL
+
+        async with ReadSession() as s:
             res = await s.exec(
-                select(Booking).where(Booking.status == "pending")
+                select(
+                    Booking.id, Booking.chat_id, Booking.date, Booking.time,
+                    Booking.reminded_24h, Booking.reminded_2h
+                ).where(
+                    Booking.status == "pending",
+                    Booking.date.between(lo.date().isoformat(), hi.date().isoformat()),
+                    (Booking.date + " " + Booking.time).between(
+                        lo.strftime("%Y-%m-%d %H:%M"), hi.strftime("%Y-%m-%d %H:%M")
+                    ),
+                    # обе отметки уже стоят — строка больше не нужна
+                    or_(Booking.reminded_24h == False, Booking.reminded_2h == False)
+                )
             )
-            for b in res.all():
-                dt = datetime.strptime(
-                    f"{b.date} {b.time}", "%Y-%m-%d %H:%M"
-                ).replace(tzinfo=IRKUTSK_TZ)
-
-                delta = dt - now
+            bookings = res.all()
 
-                if not b.reminded_24h and timedelta(hours=24) > delta > timedelta(hours=23, minutes=50):
-                    await bot.send_message(b.chat_id, "⏰ Напоминание: визит через 24 часа")
-                    b.reminded_24h = True
+        reminded_24h, reminded_2h = [], []
+        # (список для отметки, id записи, chat_id, текст)
+        due = []
+        for b in bookings:
+            dt = parse_visit(b.date, b.time)
+
+            delta = dt - now
+
+            if not b.reminded_24h:
+                if timedelta(hours=24) > delta > timedelta(hours=23, minutes=50):
+                    due.append((reminded_24h, b.id, b.chat_id, "⏰ Напоминание: визит через 24 часа"))
+                elif delta >= timedelta(hours=24):
+                    next_due = min(next_due, dt - timedelta(hours=24))
+
+            if not b.reminded_2h:
+                if timedelta(hours=2) > delta > timedelta(hours=1, minutes=50):
+                    due.append((reminded_2h, b.id, b.chat_id, "⏰ Напоминание: визит через 2 часа"))
+                elif delta >= timedelta(hours=2):
+                    next_due = min(next_due, dt - timedelta(hours=2))
+
+        # отправляем вне транзакции, пачками параллельно; отмечаем только
+        # доставленные — остальные повторим через REMINDER_RETRY, пока окно открыто
+        for i in range(0, len(due), REMINDER_BATCH):
+            batch = due[i:i + REMINDER_BATCH]
+            results = await send_all(*(
+                sender.message(bot, chat_id, text) for _, _, chat_id, text in batch
+            ))
+            for (sent, booking_id, _, _), r in zip(batch, results):
+                if isinstance(r, Exception):
+                    next_due = min(next_due, now + REMINDER_RETRY)
+                else:
+                    sent.append(booking_id)
+
+        if reminded_24h:
+            await write_queue.submit(
+                update(Booking)
+                .where(Booking.id.in_(reminded_24h))
+                .values(reminded_24h=True)
+            )
+        if reminded_2h:
+            await write_queue.submit(
+                update(Booking)
+                .where(Booking.id.in_(reminded_2h))
+                .values(reminded_2h=True)
+            )
 
-                if not b.reminded_2h and timedelta(hours=2) > delta > timedelta(hours=1, minutes=50):
-                    await bot.send_message(b.chat_id, "⏰ Напоминание: визит через 2 часа")
-                    b.reminded_2h = True
+        # +1 с: окно открыто строго после отметки 24ч/2ч
+        await asyncio.sleep(
+            max(1, (next_due - now_irkutsk()).total_seconds() + 1)
+        )
 
-            await s.commit()
 
-        await asyncio.sleep(600)
+# ================= RUN =================
+def _create_missing_indexes(conn):
+    # create_all не трогает уже существующие таблицы
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 
-# ================= RUN =================
-async def main():
-    async with engine.begin() as conn:
+async def init_db():
+    WriteSession.configure(bind=get_engine())
+    ReadSession.configure(bind=get_read_engine())
+    async with get_engine().begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
 
-    asyncio.create_task(reminder_loop())
 
-    await dp.start_polling(bot)
+async def main():
+    log_listener = setup_logging()
+    try:
+        # каталог БД и токен — только при реальном запуске, не при импорте
+        await asyncio.to_thread(PROJECT_FOLDER.mkdir, parents=True, exist_ok=True)
+        bot = Bot(get_api_token(), session=make_bot_session())
+        get_admin_ids()
+
+        await init_db()
+        await get_masters()
+        await get_admins()
+
+        # фоновые задачи и движки живут в одном процессе с поллингом
+        tasks = [
+            asyncio.create_task(write_queue.run()),
+            asyncio.create_task(reminder_loop(bot)),
+        ]
+        try:
+            await dp.start_polling(bot)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await get_read_engine().dispose()
+            await get_engine().dispose()
+    finally:
+        log_listener.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
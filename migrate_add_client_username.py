@@ -1,6 +1,5 @@
 # migrate_add_client_username.py
 import sqlite3
-import shutil
 import os
 from datetime import datetime
 
@@ -10,14 +9,17 @@ if not os.path.exists(DB_PATH):
     print("Файл БД не найден:", DB_PATH)
     raise SystemExit(1)
 
-# 1) backup
-bak_name = DB_PATH + ".bak." + datetime.now().strftime("%Y%m%d%H%M%S")
-print("Создаю резервную копию:", bak_name)
-shutil.copy2(DB_PATH, bak_name)
-
 conn = sqlite3.connect(DB_PATH)
 cur = conn.cursor()
 
+# 1) backup: backup API копирует страницы через сам SQLite — в копию
+# попадает и то, что ещё лежит в -wal, чего простое копирование файла не даёт
+bak_name = DB_PATH + ".bak." + datetime.now().strftime("%Y%m%d%H%M%S")
+print("Создаю резервную копию:", bak_name)
+bak = sqlite3.connect(bak_name)
+conn.backup(bak, pages=512)
+bak.close()
+
 # 2) check if column exists
 cur.execute("PRAGMA table_info(booking);")
 cols = [r[1] for r in cur.fetchall()]
@@ -34,7 +36,9 @@ else:
     except Exception as e:
         print("Ошибка при добавлении столбца:", e)
         print("Восстанавливаю из резервной копии...")
-        shutil.copy2(bak_name, DB_PATH)
+        bak = sqlite3.connect(bak_name)
+        bak.backup(conn)
+        bak.close()
         print("Восстановлено.")
         raise
 